@@ -1,7 +1,11 @@
 import os
 import logging
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
 from sklearn.ensemble import IsolationForest
+from threadpoolctl import threadpool_limits
+from data_preprocessing import load_cleaned_data
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -10,7 +14,54 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 TASK1_OUTPUT_DIR = os.path.join("mnt", "output", "task1")
 os.makedirs(TASK1_OUTPUT_DIR, exist_ok=True)
 
-def detect_anomalies(df, contamination=0.01, features=None):
+def build_isolation_forest(contamination=0.01, n_jobs=-1):
+    """
+    Create the IsolationForest used for anomaly detection.
+    
+    Each tree is built on 256 samples (the subsample size from the original paper), so
+    training cost does not grow with the size of the transaction data.
+    """
+    return IsolationForest(n_estimators=100, max_samples=256, bootstrap=False,
+                           contamination=contamination, n_jobs=n_jobs, random_state=42)
+
+def fit_anomaly_model(input_filepaths, contamination=0.01, features=None, n_jobs=-1):
+    """
+    Fit a single IsolationForest on the combined features of several cleaned data files.
+    
+    Only the feature columns are loaded. This is opt-in: the pipeline fits one model per
+    file, because the channels have very different amount distributions. A shared model
+    applies one global threshold, so the high-value channels take most of the flags.
+    
+    Parameters:
+      input_filepaths (list): Paths to the cleaned data files.
+      contamination (float): Proportion of anomalies expected across all files.
+      features (list): List of features to use for anomaly detection.
+      n_jobs (int): Number of parallel jobs used by IsolationForest (-1 uses all cores).
+    
+    Returns:
+      IsolationForest: The fitted model, or None if no feature data could be loaded.
+    """
+    if features is None:
+        # Default to using 'amount_cad' if no features provided.
+        features = ['amount_cad']
+
+    feature_arrays = []
+    for input_filepath in input_filepaths:
+        try:
+            feature_arrays.append(load_cleaned_data(input_filepath, columns=features).to_numpy(dtype=np.float32))
+        except Exception as e:
+            logging.error("Error loading features from %s: %s", input_filepath, e)
+    if not feature_arrays:
+        logging.error("No feature data loaded. Cannot fit the anomaly detection model.")
+        return None
+
+    X = np.concatenate(feature_arrays)
+    clf = build_isolation_forest(contamination=contamination, n_jobs=n_jobs)
+    clf.fit(X)
+    logging.info("Fitted shared anomaly detection model on %d rows from %d files.", len(X), len(feature_arrays))
+    return clf
+
+def detect_anomalies(df, contamination=0.01, features=None, n_jobs=-1, model=None):
     """
     Detect anomalies in the DataFrame using IsolationForest.
     
@@ -18,6 +69,8 @@ def detect_anomalies(df, contamination=0.01, features=None):
       df (pd.DataFrame): DataFrame with cleaned transaction data.
       contamination (float): The proportion of anomalies in the data.
       features (list): List of column names to use for anomaly detection.
+      n_jobs (int): Number of parallel jobs used to fit and score the trees (-1 uses all cores).
+      model (IsolationForest): Already fitted model to score with. If None, a new model is fitted on df.
     
     Returns:
       pd.DataFrame: Original DataFrame with two additional columns:
@@ -34,58 +87,97 @@ def detect_anomalies(df, contamination=0.01, features=None):
         logging.error("No valid features found for anomaly detection.")
         return df
 
-    # Fit the IsolationForest model on the selected features
-    clf = IsolationForest(contamination=contamination, random_state=42)
-    df['anomaly_score'] = clf.fit_predict(df[available_features])
-    df['is_anomaly'] = df['anomaly_score'] == -1  # In IsolationForest, -1 indicates an anomaly
+    # Score with the provided model, or fit an IsolationForest model on the selected features.
+    # Predictions are only -1/1, so store them as int8 and derive the flag from the raw array
+    X = df[available_features].to_numpy(dtype=np.float32)
+    if model is not None:
+        scores = model.predict(X).astype(np.int8)
+    else:
+        clf = build_isolation_forest(contamination=contamination, n_jobs=n_jobs)
+        scores = clf.fit_predict(X).astype(np.int8)
+    df['anomaly_score'] = scores
+    df['is_anomaly'] = scores < 0  # In IsolationForest, -1 indicates an anomaly
 
-    logging.info(f"Anomaly detection: Found {df['is_anomaly'].sum()} anomalies out of {len(df)} rows.")
+    # Counting the anomalies is a full pass over the column, so only do it when the message will be logged
+    if logging.getLogger().isEnabledFor(logging.INFO):
+        logging.info("Anomaly detection: Found %d anomalies out of %d rows.",
+                     np.count_nonzero(df['is_anomaly'].to_numpy()), len(df))
     return df
 
-def run_anomaly_detection(input_filepath, output_filename, contamination=0.01, features=None):
+def run_anomaly_detection(input_filepath, output_filename, contamination=0.01, features=None, n_jobs=-1, model=None):
     """
-    Run anomaly detection on a cleaned CSV file and save the results.
+    Run anomaly detection on a cleaned data file and save the results.
     
     Parameters:
-      input_filepath (str): Path to the cleaned CSV file (e.g., mnt/output/clean/cleaned_abm.csv).
+      input_filepath (str): Path to the cleaned Parquet file (e.g., mnt/output/clean/cleaned_abm.parquet).
       output_filename (str): Name of the file to save the anomaly detection results (e.g., anomaly_detected_abm.csv).
       contamination (float): Proportion of anomalies expected in the data.
       features (list): List of features to use for anomaly detection.
+      n_jobs (int): Number of parallel jobs used by IsolationForest (-1 uses all cores).
+      model (IsolationForest): Already fitted model to score with. If None, a new model is fitted on the file.
     """
     try:
-        df = pd.read_csv(input_filepath)
-        logging.info(f"Loaded data from {input_filepath} with {len(df)} rows.")
+        df = load_cleaned_data(input_filepath)
+        logging.info("Loaded data from %s with %d rows.", input_filepath, len(df))
     except Exception as e:
-        logging.error(f"Error loading {input_filepath}: {e}")
+        logging.error("Error loading %s: %s", input_filepath, e)
         return
 
     # Run anomaly detection on the dataframe
-    df = detect_anomalies(df, contamination=contamination, features=features)
+    df = detect_anomalies(df, contamination=contamination, features=features, n_jobs=n_jobs, model=model)
     
     # Save the results to the task1 output directory
     output_path = os.path.join(TASK1_OUTPUT_DIR, output_filename)
     try:
         df.to_csv(output_path, index=False)
-        logging.info(f"Anomaly detection results saved to {output_path}.")
+        logging.info("Anomaly detection results saved to %s.", output_path)
     except Exception as e:
-        logging.error(f"Error saving anomaly detection results: {e}")
+        logging.error("Error saving anomaly detection results: %s", e)
+
+def _init_worker():
+    """Limit each worker process's native (OpenMP/BLAS) thread pools to one thread so parallel fits don't contend for cores."""
+    threadpool_limits(limits=1)
+
+def run_anomaly_detection_parallel(input_filepaths, output_filenames, contamination=0.01, features=None, max_workers=None,
+                                   model=None, reserved_cores=0):
+    """
+    Run anomaly detection on several independent files concurrently, one worker process per file.
+    
+    Parameters:
+      input_filepaths (list): Paths to the cleaned data files.
+      output_filenames (list): Output file names, in the same order as input_filepaths.
+      contamination (float): Proportion of anomalies expected in the data.
+      features (list): List of features to use for anomaly detection.
+      max_workers (int): Number of worker processes. Defaults to one per file, capped at the available cores.
+      model (IsolationForest): Already fitted model shared by all files (see fit_anomaly_model).
+                               If None, each file gets its own model.
+      reserved_cores (int): Cores left free for work running alongside (e.g., the embeddings process).
+    """
+    available_cores = max(1, (os.cpu_count() or 1) - reserved_cores)
+    if max_workers is None:
+        max_workers = min(len(input_filepaths), available_cores)
+    # Give each worker's IsolationForest an equal share of the available cores
+    n_jobs = max(1, available_cores // max_workers)
+    worker = partial(run_anomaly_detection, contamination=contamination, features=features, n_jobs=n_jobs, model=model)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        list(executor.map(worker, input_filepaths, output_filenames))
 
 if __name__ == "__main__":
     # List of cleaned transaction files to process
     transaction_files = [
-        "cleaned_abm.csv",
-        "cleaned_card.csv",
-        "cleaned_cheque.csv",
-        "cleaned_eft.csv",
-        "cleaned_emt.csv",
-        "cleaned_wire.csv"
+        "cleaned_abm.parquet",
+        "cleaned_card.parquet",
+        "cleaned_cheque.parquet",
+        "cleaned_eft.parquet",
+        "cleaned_emt.parquet",
+        "cleaned_wire.parquet"
     ]
     
     input_dir = os.path.join("mnt", "output", "clean")
     
-    # Process each file and save the anomaly detection output with a prefixed name.
-    for file_name in transaction_files:
-        input_file = os.path.join(input_dir, file_name)
-        # Generate output file name, e.g., "anomaly_detected_abm.csv"
-        output_file = "anomaly_detected_" + file_name.split("_")[1]
-        run_anomaly_detection(input_file, output_file, contamination=0.01, features=['amount_cad'])
+    # Process the files in parallel and save each anomaly detection output with a prefixed name.
+    input_files = [os.path.join(input_dir, file_name) for file_name in transaction_files]
+    # Generate output file names, e.g., "anomaly_detected_abm.csv"
+    output_files = ["anomaly_detected_" + os.path.splitext(file_name.split("_")[1])[0] + ".csv"
+                    for file_name in transaction_files]
+    run_anomaly_detection_parallel(input_files, output_files, contamination=0.01, features=['amount_cad'])
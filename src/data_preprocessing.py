@@ -1,6 +1,12 @@
 import os
 import logging
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -9,41 +15,108 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 RAW_DATA_DIR = os.path.join("mnt", "data")
 CLEAN_OUTPUT_DIR = os.path.join("mnt", "output", "clean")
 
+# Number of raw transaction rows read and cleaned at a time
+CHUNK_SIZE = 500_000
+
+# Column types of the raw transaction files, so read_csv can skip type inference.
+# Columns missing from a given file are ignored. 'amount_cad' is left out on purpose:
+# clean_transactions converts it with to_numeric(errors='coerce'), so a malformed amount
+# becomes NaN instead of failing the whole read.
+TXN_DTYPES = {
+    'customer_id': str,
+    'debit_credit': str,
+    'merchant_category': str,
+    'country': str,
+    'province': str,
+    'city': str,
+    'transaction_time': str,
+}
+TXN_DATE_COLS = ['transaction_date']
+
+# Case normalization applied to string columns after whitespace stripping
+TXN_CASE_KERNELS = {
+    'debit_credit': pc.utf8_lower,
+    'country': pc.utf8_upper,
+    'province': pc.utf8_upper,
+    'city': pc.utf8_upper,
+}
+KYC_CASE_KERNELS = {
+    'country': pc.utf8_upper,
+    'province': pc.utf8_upper,
+    'city': pc.utf8_upper,
+    'industry_code': pc.utf8_upper,
+}
+
 # Ensure the cleaned output directory exists
 os.makedirs(CLEAN_OUTPUT_DIR, exist_ok=True)
 
 def file_exists(filepath):
     if not os.path.exists(filepath):
-        logging.error(f"File not found: {filepath}")
+        logging.error("File not found: %s", filepath)
         return False
     return True
 
+def apply_string_kernels(series, *kernels):
+    """
+    Applies PyArrow compute string kernels (e.g. pc.utf8_trim_whitespace, pc.utf8_upper)
+    to a string Series in the given order and returns the result with the original index.
+    
+    As with the pandas .str accessor, non-string values become missing. Non-string
+    columns are returned unchanged.
+    """
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return series
+    try:
+        arr = pa.array(series, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type column: keep only the string values
+        arr = pa.array(series.where(series.map(type) == str), type=pa.string(), from_pandas=True)
+    for kernel in kernels:
+        arr = kernel(arr)
+    return pd.Series(arr.to_numpy(zero_copy_only=False), index=series.index, name=series.name)
+
+def normalize_string_columns(df, case_kernels):
+    """
+    Strips extra whitespace from every string column and applies the column's case
+    kernel from case_kernels (if any) in the same pass.
+    """
+    for col in df.select_dtypes(include=['object']).columns:
+        kernels = [pc.utf8_trim_whitespace]
+        if col in case_kernels:
+            kernels.append(case_kernels[col])
+        df[col] = apply_string_kernels(df[col], *kernels)
+    return df
+
 def clean_transactions(df, date_cols=['transaction_date'], numeric_cols=['amount_cad']):
     """
     Cleans a transaction DataFrame by:
+      - Dropping rows missing 'customer_id'
       - Dropping duplicate rows
-      - Stripping extra whitespace from string columns
+      - Stripping extra whitespace from string columns, standardizing 'debit_credit' to lowercase
+        and geographic columns ('country', 'province', 'city') to uppercase in the same pass
       - Converting date columns to datetime
       - Combining 'transaction_date' and 'transaction_time' into a new datetime column (if both exist)
       - Converting specified numeric columns to numeric types
-      - Standardizing 'debit_credit' to lowercase
-      - Standardizing geographic columns ('country', 'province', 'city') to uppercase
-      - Dropping rows missing 'customer_id'
+      - Storing the geographic and 'debit_credit' columns as categoricals
+    
+    The input DataFrame is not modified; the cleaned result has a fresh RangeIndex.
     """
     initial_rows = len(df)
-    df = df.copy()
 
     try:
-        df.drop_duplicates(inplace=True)
+        # Drop rows missing 'customer_id' up front; the filtered frame replaces a full copy of the input
+        if 'customer_id' in df.columns:
+            df = df.loc[df['customer_id'].notna()]
+        df = df.drop_duplicates().reset_index(drop=True)
     except Exception as e:
-        logging.error(f"Error dropping duplicates: {e}")
+        logging.error("Error dropping rows missing 'customer_id' or duplicates: %s", e)
+        df = df.copy()
 
     try:
-        # Strip extra whitespace from all object-type columns
-        for col in df.select_dtypes(include=['object']).columns:
-            df[col] = df[col].str.strip()
+        # Strip whitespace and standardize case of all object-type columns in one pass
+        df = normalize_string_columns(df, TXN_CASE_KERNELS)
     except Exception as e:
-        logging.error(f"Error stripping whitespace: {e}")
+        logging.error("Error normalizing string columns: %s", e)
 
     try:
         # Convert date columns to datetime
@@ -51,51 +124,37 @@ def clean_transactions(df, date_cols=['transaction_date'], numeric_cols=['amount
             if col in df.columns:
                 df[col] = pd.to_datetime(df[col], errors='coerce')
     except Exception as e:
-        logging.error(f"Error converting date columns: {e}")
+        logging.error("Error converting date columns: %s", e)
 
     try:
         # Combine 'transaction_date' and 'transaction_time' if available
         if 'transaction_date' in df.columns and 'transaction_time' in df.columns:
             df['transaction_time'] = df['transaction_time'].fillna("00:00:00")
-            df['transaction_datetime'] = pd.to_datetime(
-                df['transaction_date'].dt.strftime('%Y-%m-%d') + ' ' + df['transaction_time'],
-                errors='coerce'
-            )
+            # Add the time of day as a timedelta instead of formatting and re-parsing strings
+            time_of_day = pd.to_timedelta(df['transaction_time'], errors='coerce')
+            df['transaction_datetime'] = df['transaction_date'].dt.normalize() + time_of_day
     except Exception as e:
-        logging.error(f"Error combining date and time: {e}")
+        logging.error("Error combining date and time: %s", e)
 
     try:
-        # Convert specified numeric columns to numeric types
+        # Convert specified numeric columns to float64 numbers, so cents are kept and every chunk
+        # of a streamed file gets the same type; the anomaly model builds its own float32 matrix
         for col in numeric_cols:
             if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
     except Exception as e:
-        logging.error(f"Error converting numeric columns: {e}")
+        logging.error("Error converting numeric columns: %s", e)
 
     try:
-        # Standardize the 'debit_credit' column to lowercase if present
-        if 'debit_credit' in df.columns:
-            df['debit_credit'] = df['debit_credit'].str.lower()
-    except Exception as e:
-        logging.error(f"Error standardizing 'debit_credit': {e}")
-
-    try:
-        # Standardize geographic columns to uppercase
-        for col in ['country', 'province', 'city']:
+        # Store low-cardinality string columns as categoricals
+        for col in ['country', 'province', 'city', 'debit_credit']:
             if col in df.columns:
-                df[col] = df[col].str.upper()
-    except Exception as e:
-        logging.error(f"Error standardizing geographic columns: {e}")
-
-    try:
-        # Drop rows missing 'customer_id'
-        if 'customer_id' in df.columns:
-            df.dropna(subset=['customer_id'], inplace=True)
+                df[col] = df[col].astype('category')
     except Exception as e:
-        logging.error(f"Error dropping rows missing 'customer_id': {e}")
+        logging.error("Error converting columns to categoricals: %s", e)
 
     final_rows = len(df)
-    logging.info(f"Transactions cleaned: {initial_rows} -> {final_rows} rows")
+    logging.info("Transactions cleaned: %d -> %d rows", initial_rows, final_rows)
     return df
 
 def clean_bool_columns(df, bool_columns):
@@ -107,7 +166,7 @@ def clean_bool_columns(df, bool_columns):
             try:
                 df[col] = df[col].astype(bool)
             except Exception as e:
-                logging.error(f"Error converting {col} to bool: {e}")
+                logging.error("Error converting %s to bool: %s", col, e)
     return df
 
 def clean_kyc_data(df):
@@ -115,10 +174,10 @@ def clean_kyc_data(df):
     Cleans a KYC DataFrame by:
       - Resetting the index so that 'customer_id' becomes a column
       - Dropping duplicate rows
-      - Stripping extra whitespace from string columns
+      - Stripping extra whitespace from string columns and standardizing geographic and
+        industry code columns to uppercase in the same pass
       - Converting date columns to datetime
       - Converting numeric columns (e.g., 'sales', 'employee_count') to numeric types
-      - Standardizing geographic and industry code columns to uppercase
       - Dropping rows missing 'customer_id'
     """
     initial_rows = len(df)
@@ -128,13 +187,12 @@ def clean_kyc_data(df):
         df.reset_index(inplace=True)
         df.drop_duplicates(inplace=True)
     except Exception as e:
-        logging.error(f"Error resetting index or dropping duplicates in KYC: {e}")
+        logging.error("Error resetting index or dropping duplicates in KYC: %s", e)
 
     try:
-        for col in df.select_dtypes(include=['object']).columns:
-            df[col] = df[col].str.strip()
+        df = normalize_string_columns(df, KYC_CASE_KERNELS)
     except Exception as e:
-        logging.error(f"Error stripping whitespace in KYC data: {e}")
+        logging.error("Error normalizing string columns in KYC data: %s", e)
 
     try:
         if 'established_date' in df.columns:
@@ -142,7 +200,7 @@ def clean_kyc_data(df):
         if 'onboard_date' in df.columns:
             df['onboard_date'] = pd.to_datetime(df['onboard_date'], errors='coerce')
     except Exception as e:
-        logging.error(f"Error converting date columns in KYC data: {e}")
+        logging.error("Error converting date columns in KYC data: %s", e)
 
     try:
         if 'sales' in df.columns:
@@ -150,22 +208,15 @@ def clean_kyc_data(df):
         if 'employee_count' in df.columns:
             df['employee_count'] = pd.to_numeric(df['employee_count'], errors='coerce')
     except Exception as e:
-        logging.error(f"Error converting numeric columns in KYC data: {e}")
-
-    try:
-        for col in ['country', 'province', 'city', 'industry_code']:
-            if col in df.columns:
-                df[col] = df[col].str.upper()
-    except Exception as e:
-        logging.error(f"Error standardizing columns in KYC data: {e}")
+        logging.error("Error converting numeric columns in KYC data: %s", e)
 
     try:
         df.dropna(subset=['customer_id'], inplace=True)
     except Exception as e:
-        logging.error(f"Error dropping rows with missing customer_id in KYC: {e}")
+        logging.error("Error dropping rows with missing customer_id in KYC: %s", e)
 
     final_rows = len(df)
-    logging.info(f"KYC data cleaned: {initial_rows} -> {final_rows} rows")
+    logging.info("KYC data cleaned: %d -> %d rows", initial_rows, final_rows)
     return df
 
 def clean_kyc_industry_codes(df):
@@ -181,45 +232,188 @@ def clean_kyc_industry_codes(df):
         df.reset_index(inplace=True)
         df.rename(columns={'index': 'industry_code'}, inplace=True)
         for col in df.select_dtypes(include=['object']).columns:
-            df[col] = df[col].str.strip().str.upper()
+            df[col] = apply_string_kernels(df[col], pc.utf8_trim_whitespace, pc.utf8_upper)
     except Exception as e:
-        logging.error(f"Error cleaning KYC industry codes data: {e}")
+        logging.error("Error cleaning KYC industry codes data: %s", e)
     return df
 
+def remove_cleaned_files(output_path):
+    """
+    Removes an earlier Parquet file and its Feather copy, so load_cleaned_data never
+    returns a stale Feather copy after a failed or partial rewrite.
+    
+    Parameters:
+      output_path (str): Path of the cleaned Parquet file.
+    """
+    for path in (output_path, output_path.replace('.parquet', '.feather')):
+        if os.path.exists(path):
+            os.remove(path)
+
 def save_cleaned_data(df, filename):
     """
-    Saves the given DataFrame to the CLEAN_OUTPUT_DIR with the provided filename.
+    Saves the given DataFrame to the CLEAN_OUTPUT_DIR as a zstd-compressed Parquet file,
+    plus a Feather copy used for fast hand-off to the later pipeline stages.
+    A '.csv' extension in the provided filename is replaced with '.parquet' / '.feather'.
+    """
+    output_path = os.path.join(CLEAN_OUTPUT_DIR, filename.replace('.csv', '.parquet'))
+    try:
+        remove_cleaned_files(output_path)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, output_path, compression='zstd')
+        feather.write_feather(table, output_path.replace('.parquet', '.feather'))
+        logging.info("Saved cleaned data to %s", output_path)
+    except Exception as e:
+        logging.error("Error saving file %s: %s", filename, e)
+
+def load_cleaned_data(filepath, columns=None):
+    """
+    Loads a cleaned DataFrame written by save_cleaned_data.
+    
+    Reads the Feather copy if it exists, then the Parquet file; otherwise falls back to the
+    CSV with the same base name (cleaned outputs produced before the switch to Parquet),
+    parsed with the multi-threaded PyArrow CSV reader. If columns is given, only those
+    columns are read.
+    
+    Categorical columns that the Feather copy stores as plain strings (see
+    clean_transaction_file) are converted back to categoricals.
+    """
+    base, _ = os.path.splitext(filepath)
+    feather_path = base + ".feather"
+    if os.path.exists(feather_path):
+        table = feather.read_table(feather_path, columns=columns)
+        categories = [col['name'] for col in (table.schema.pandas_metadata or {}).get('columns', [])
+                      if col['pandas_type'] == 'categorical' and col['name'] in table.column_names]
+        return table.to_pandas(categories=categories)
+    parquet_path = base + ".parquet"
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path, columns=columns)
+    convert_options = pv.ConvertOptions(include_columns=columns or [])
+    return pv.read_csv(base + ".csv", convert_options=convert_options).to_pandas(self_destruct=True)
+
+def find_seen_rows(row_hashes, seen_hashes):
+    """
+    Flags rows whose hash was already seen in an earlier chunk.
+    
+    The seen hashes are kept as one sorted uint64 array (8 bytes per row). The chunk's hashes
+    are sorted before the lookup, so the binary search walks the array in order, and the merge
+    is a stable sort, which only has to merge the two sorted runs.
+    
+    Parameters:
+      row_hashes (np.ndarray): uint64 hashes of the chunk's rows.
+      seen_hashes (np.ndarray): Sorted uint64 hashes of the rows of earlier chunks.
+    
+    Returns:
+      tuple: Boolean mask of the rows already seen, and the updated sorted hash array.
+    """
+    order = np.argsort(row_hashes)
+    sorted_hashes = row_hashes[order]
+    is_seen = np.zeros(len(row_hashes), dtype=bool)
+    if len(seen_hashes):
+        positions = np.minimum(np.searchsorted(seen_hashes, sorted_hashes), len(seen_hashes) - 1)
+        is_seen[order] = seen_hashes[positions] == sorted_hashes
+    seen_hashes = np.concatenate([seen_hashes, sorted_hashes])
+    seen_hashes.sort(kind='stable')
+    return is_seen, seen_hashes
+
+def clean_transaction_file(input_path, filename, bool_columns=None, absolute_amounts=False, chunksize=CHUNK_SIZE):
     """
-    output_path = os.path.join(CLEAN_OUTPUT_DIR, filename)
+    Cleans a raw transaction CSV chunk by chunk and streams the cleaned rows to a Parquet
+    file and its Feather copy in CLEAN_OUTPUT_DIR, so only one chunk of the file is held
+    in memory at a time. Duplicates are dropped across the whole file, which also keeps an
+    8-byte hash per raw row (see find_seen_rows). If cleaning fails, the partial outputs
+    are removed.
+    
+    Parameters:
+      input_path (str): Path to the raw transaction CSV (e.g., mnt/data/abm.csv).
+      filename (str): Name of the cleaned output file; '.csv' is replaced with '.parquet'.
+      bool_columns (list): Columns to convert to booleans with clean_bool_columns.
+      absolute_amounts (bool): Whether to convert negative 'amount_cad' values to absolute values.
+      chunksize (int): Number of raw rows to read and clean at a time.
+    """
+    output_path = os.path.join(CLEAN_OUTPUT_DIR, filename.replace('.csv', '.parquet'))
+    feather_path = output_path.replace('.parquet', '.feather')
+    remove_cleaned_files(output_path)
+    writer = None
+    feather_writer = None
+    # Row hashes of earlier chunks, so duplicates are dropped across the whole file
+    seen_hashes = np.empty(0, dtype=np.uint64)
     try:
-        df.to_csv(output_path, index=False)
-        logging.info(f"Saved cleaned data to {output_path}")
+        for chunk in pd.read_csv(input_path, index_col=0, dtype=TXN_DTYPES, parse_dates=TXN_DATE_COLS,
+                                 chunksize=chunksize):
+            row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+            is_seen, seen_hashes = find_seen_rows(row_hashes, seen_hashes)
+            chunk = chunk[~is_seen]
+
+            chunk = clean_transactions(chunk, date_cols=TXN_DATE_COLS, numeric_cols=['amount_cad'])
+            if absolute_amounts and 'amount_cad' in chunk.columns:
+                # Take absolute values in place on the amount buffer (copied only if it is read-only)
+                amounts = np.require(chunk['amount_cad'].to_numpy(), requirements=['C', 'W'])
+                np.abs(amounts, out=amounts)
+                chunk['amount_cad'] = amounts
+            chunk = clean_bool_columns(chunk, bool_columns or [])
+            if chunk.empty:
+                continue
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # Columns that are entirely missing in the first chunk are typed as strings, and
+                # categorical indices are widened to int32, since pandas picks int8 or int16 codes
+                # per chunk from that chunk's number of categories
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_null(field.type)
+                    else field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                    if pa.types.is_dictionary(field.type) else field
+                    for field in table.schema
+                ], metadata=table.schema.metadata)
+                # The Arrow IPC file format cannot replace a categorical's dictionary between
+                # chunks, so the Feather copy stores those columns as plain strings
+                feather_schema = pa.schema([
+                    field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                    for field in schema
+                ], metadata=schema.metadata)
+                writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+                feather_writer = pa.ipc.new_file(feather_path, feather_schema,
+                                                 options=pa.ipc.IpcWriteOptions(compression='lz4'))
+            table = table.cast(schema)
+            writer.write_table(table)
+            feather_writer.write_table(table.cast(feather_schema))
     except Exception as e:
-        logging.error(f"Error saving file {filename}: {e}")
+        logging.error("Error cleaning %s: %s", input_path, e)
+        for open_writer in (writer, feather_writer):
+            if open_writer is not None:
+                open_writer.close()
+        remove_cleaned_files(output_path)
+        raise
+
+    if writer is None:
+        logging.warning("No rows found in %s. No cleaned file was written.", input_path)
+        return
+    writer.close()
+    feather_writer.close()
+
+    if absolute_amounts:
+        logging.info("Converted negative amounts in %s to absolute values.", filename)
+    logging.info("Saved cleaned data to %s", output_path)
 
 if __name__ == "__main__":
-    # List of raw data files to load for transactions
+    # Raw transaction files and the boolean columns to convert in each
     transaction_files = {
-        "abm.csv": None,
-        "card.csv": None,
-        "cheque.csv": None,
-        "eft.csv": None,
-        "emt.csv": None,
-        "wire.csv": None
+        "abm.csv": ['cash_indicator'],
+        "card.csv": ['ecommerce_ind'],
+        "cheque.csv": [],
+        "eft.csv": [],
+        "emt.csv": [],
+        "wire.csv": []
     }
 
-    # Load each transaction file if it exists
-    for file_name in transaction_files.keys():
+    # Clean and save each transaction file in turn, streaming it in chunks
+    for file_name, bool_columns in transaction_files.items():
         file_path = os.path.join(RAW_DATA_DIR, file_name)
-        if file_exists(file_path):
-            try:
-                transaction_files[file_name] = pd.read_csv(file_path, index_col=0)
-                logging.info(f"Loaded {file_name}")
-            except Exception as e:
-                logging.error(f"Error loading {file_name}: {e}")
-                raise
-        else:
+        if not file_exists(file_path):
             raise FileNotFoundError(f"{file_path} not found.")
+        # Additional enhancement: For card data, convert negative amounts to absolute values
+        clean_transaction_file(file_path, "cleaned_" + file_name, bool_columns=bool_columns,
+                               absolute_amounts=(file_name == "card.csv"))
 
     # Load raw KYC and industry codes data
     kyc_file = os.path.join(RAW_DATA_DIR, "kyc.csv")
@@ -231,38 +425,13 @@ if __name__ == "__main__":
         kyc_industry_codes = pd.read_csv(kyc_industry_codes_file, index_col=0)
         logging.info("Loaded KYC data files.")
     except Exception as e:
-        logging.error(f"Error loading KYC data: {e}")
+        logging.error("Error loading KYC data: %s", e)
         raise
 
-    # Clean transaction data
-    abm_data = clean_transactions(transaction_files["abm.csv"], date_cols=['transaction_date'], numeric_cols=['amount_cad'])
-    card_data = clean_transactions(transaction_files["card.csv"], date_cols=['transaction_date'], numeric_cols=['amount_cad'])
-    cheque_data = clean_transactions(transaction_files["cheque.csv"], date_cols=['transaction_date'], numeric_cols=['amount_cad'])
-    eft_data = clean_transactions(transaction_files["eft.csv"], date_cols=['transaction_date'], numeric_cols=['amount_cad'])
-    emt_data = clean_transactions(transaction_files["emt.csv"], date_cols=['transaction_date'], numeric_cols=['amount_cad'])
-    wire_data = clean_transactions(transaction_files["wire.csv"], date_cols=['transaction_date'], numeric_cols=['amount_cad'])
-
-    # Additional enhancement: For card_data, convert negative amounts to absolute values
-    if 'amount_cad' in card_data.columns:
-        card_data['amount_cad'] = card_data['amount_cad'].abs()
-        logging.info("Converted negative amounts in card_data to absolute values.")
-
-    # Convert known boolean columns explicitly
-    abm_data = clean_bool_columns(abm_data, ['cash_indicator'])
-    card_data = clean_bool_columns(card_data, ['ecommerce_ind'])
-
     # Clean KYC data and industry codes
     kyc_data = clean_kyc_data(kyc_data)
     kyc_industry_codes = clean_kyc_industry_codes(kyc_industry_codes)
 
-    # Save cleaned transaction data
-    save_cleaned_data(abm_data, "cleaned_abm.csv")
-    save_cleaned_data(card_data, "cleaned_card.csv")
-    save_cleaned_data(cheque_data, "cleaned_cheque.csv")
-    save_cleaned_data(eft_data, "cleaned_eft.csv")
-    save_cleaned_data(emt_data, "cleaned_emt.csv")
-    save_cleaned_data(wire_data, "cleaned_wire.csv")
-
     # Save cleaned KYC data and industry codes
     save_cleaned_data(kyc_data, "cleaned_kyc.csv")
     save_cleaned_data(kyc_industry_codes, "cleaned_kyc_industry_codes.csv")
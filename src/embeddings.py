@@ -1,10 +1,8 @@
 import os
 import logging
-import pandas as pd
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import Model # type: ignore
-from tensorflow.keras.layers import Input, Dense # type: ignore
+from sklearn.decomposition import TruncatedSVD
+from data_preprocessing import load_cleaned_data
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,25 +13,29 @@ TASK3_OUTPUT_DIR = os.path.join("mnt", "output", "task3")
 os.makedirs(TASK3_OUTPUT_DIR, exist_ok=True)
 
 def load_kyc_data():
-    """Load the cleaned KYC data from mnt/output/clean/cleaned_kyc.csv."""
-    kyc_file = os.path.join(CLEAN_DATA_DIR, "cleaned_kyc.csv")
+    """Load the cleaned KYC data from mnt/output/clean/cleaned_kyc.parquet."""
+    kyc_file = os.path.join(CLEAN_DATA_DIR, "cleaned_kyc.parquet")
     try:
-        df = pd.read_csv(kyc_file)
-        logging.info(f"Loaded KYC data with {len(df)} rows.")
+        df = load_cleaned_data(kyc_file)
+        logging.info("Loaded KYC data with %d rows.", len(df))
         return df
     except Exception as e:
-        logging.error(f"Error loading KYC data: {e}")
+        logging.error("Error loading KYC data: %s", e)
         return None
 
 def preprocess_kyc_data(df, feature_cols):
     """
     Selects the given feature columns from the KYC DataFrame,
     fills missing values, and applies simple min-max normalization.
+    Returns a C-contiguous float32 array.
     """
-    X = df[feature_cols].fillna(0)
-    # Simple min-max scaling
-    X_norm = (X - X.min()) / (X.max() - X.min() + 1e-6)
-    return X_norm.values
+    X = np.ascontiguousarray(df[feature_cols].to_numpy(dtype=np.float32))
+    np.nan_to_num(X, copy=False)
+    # Simple min-max scaling, done in place on the float32 array
+    mn = X.min(axis=0)
+    X -= mn
+    X /= X.max(axis=0) + 1e-6
+    return X
 
 def build_autoencoder(input_dim, embedding_dim=16):
     """
@@ -47,28 +49,89 @@ def build_autoencoder(input_dim, embedding_dim=16):
       autoencoder (Model): Compiled autoencoder model.
       encoder (Model): Model to extract embeddings.
     """
+    # TensorFlow is only imported when the autoencoder is actually used
+    from tensorflow.keras.models import Model # type: ignore
+    from tensorflow.keras.layers import Input, Dense # type: ignore
+
     input_layer = Input(shape=(input_dim,))
-    # Encoder
+    # Encoder (the embedding and output layers stay float32 when mixed precision is enabled)
     encoded = Dense(32, activation='relu')(input_layer)
-    encoded = Dense(embedding_dim, activation='relu')(encoded)
+    encoded = Dense(embedding_dim, activation='relu', dtype='float32')(encoded)
     # Decoder
     decoded = Dense(32, activation='relu')(encoded)
-    decoded = Dense(input_dim, activation='sigmoid')(decoded)
+    decoded = Dense(input_dim, activation='sigmoid', dtype='float32')(decoded)
     
     autoencoder = Model(inputs=input_layer, outputs=decoded)
     encoder = Model(inputs=input_layer, outputs=encoded)
     
-    autoencoder.compile(optimizer='adam', loss='mse')
+    # Compile the training step with XLA
+    autoencoder.compile(optimizer='adam', loss='mse', jit_compile=True)
     return autoencoder, encoder
 
-def generate_customer_embeddings(feature_cols, epochs=20, batch_size=32):
+def compute_svd_embeddings(X, embedding_dim=16):
+    """
+    Projects the features onto their top singular vectors with TruncatedSVD.
+    
+    Parameters:
+      X (np.ndarray): Normalized feature matrix.
+      embedding_dim (int): Maximum dimension of the embedding; capped at the number of features.
+    
+    Returns:
+      np.ndarray: Embeddings with min(embedding_dim, number of features) columns.
+    """
+    n_components = min(embedding_dim, X.shape[1])
+    logging.info("Computing TruncatedSVD embeddings with %d components.", n_components)
+    svd = TruncatedSVD(n_components=n_components, random_state=42)
+    return svd.fit_transform(X)
+
+def train_autoencoder_embeddings(X, embedding_dim=16, epochs=20, batch_size=32):
+    """
+    Trains the autoencoder on the features and returns the encoder output.
+    
+    Parameters:
+      X (np.ndarray): Normalized feature matrix.
+      embedding_dim (int): Dimension of the latent embedding.
+      epochs (int): Number of epochs to train the autoencoder.
+      batch_size (int): Batch size for training.
+    
+    Returns:
+      np.ndarray: Embeddings with embedding_dim columns.
+    """
+    import tensorflow as tf
+
+    input_dim = X.shape[1]
+    
+    # Use float16 compute on GPUs; on CPUs mixed precision is slower, so stay in float32
+    if tf.config.list_physical_devices('GPU'):
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+        logging.info("GPU found. Training with the mixed_float16 policy.")
+    
+    logging.info("Building autoencoder with input dimension %d and embedding dimension %d.", input_dim, embedding_dim)
+    
+    # Build and train the autoencoder, feeding it from a cached, prefetched tf.data pipeline
+    autoencoder, encoder = build_autoencoder(input_dim, embedding_dim=embedding_dim)
+    dataset = (tf.data.Dataset.from_tensor_slices((X, X))
+               .cache()
+               .shuffle(len(X))
+               .batch(batch_size)
+               .prefetch(tf.data.AUTOTUNE))
+    logging.info("Training autoencoder...")
+    autoencoder.fit(dataset, epochs=epochs, verbose=1)
+    
+    # Generate embeddings using the encoder model
+    return encoder.predict(X)
+
+def generate_customer_embeddings(feature_cols, epochs=20, batch_size=32, method='auto', embedding_dim=16):
     """
-    Generates customer embeddings using an autoencoder trained on selected features.
+    Generates customer embeddings from selected KYC features.
     
     Parameters:
       feature_cols (list): List of column names from KYC data to use as features.
       epochs (int): Number of epochs to train the autoencoder.
       batch_size (int): Batch size for training.
+      method (str): 'svd' for a TruncatedSVD projection, 'autoencoder' to train the autoencoder,
+                    or 'auto' to use SVD unless there are more features than embedding dimensions.
+      embedding_dim (int): Dimension of the embedding.
     """
     # Load KYC data
     df = load_kyc_data()
@@ -78,32 +141,27 @@ def generate_customer_embeddings(feature_cols, epochs=20, batch_size=32):
     
     # Preprocess data and prepare features
     X = preprocess_kyc_data(df, feature_cols)
-    input_dim = X.shape[1]
-    logging.info(f"Building autoencoder with input dimension {input_dim} and embedding dimension 16.")
     
-    # Build and train the autoencoder
-    autoencoder, encoder = build_autoencoder(input_dim, embedding_dim=16)
-    logging.info("Training autoencoder...")
-    autoencoder.fit(X, X, epochs=epochs, batch_size=batch_size, verbose=1)
-    
-    # Generate embeddings using the encoder model
-    embeddings = encoder.predict(X)
+    # With no more features than embedding dimensions, an autoencoder cannot find more
+    # structure than a linear projection of the inputs, so SVD is used instead
+    if method == 'auto':
+        method = 'svd' if X.shape[1] <= embedding_dim else 'autoencoder'
+    if method == 'svd':
+        embeddings = compute_svd_embeddings(X, embedding_dim=embedding_dim)
+    else:
+        embeddings = train_autoencoder_embeddings(X, embedding_dim=embedding_dim, epochs=epochs, batch_size=batch_size)
     
     # Prepare output: each line starts with customer_id followed by the embedding vector values
-    output_lines = []
-    customer_ids = df['customer_id'].astype(str).values
-    for cid, emb in zip(customer_ids, embeddings):
-        emb_str = ", ".join(f"{x:.8f}" for x in emb)
-        output_lines.append(f"{cid}, {emb_str}")
+    output_rows = np.empty((len(embeddings), embeddings.shape[1] + 1), dtype=object)
+    output_rows[:, 0] = df['customer_id'].astype(str).values
+    output_rows[:, 1:] = embeddings
     
     output_file = os.path.join(TASK3_OUTPUT_DIR, "customer_embeddings.txt")
     try:
-        with open(output_file, "w") as f:
-            for line in output_lines:
-                f.write(line + "\n")
-        logging.info(f"Customer embeddings saved to {output_file}")
+        np.savetxt(output_file, output_rows, fmt=['%s'] + ['%.8f'] * embeddings.shape[1], delimiter=', ')
+        logging.info("Customer embeddings saved to %s", output_file)
     except Exception as e:
-        logging.error(f"Error saving customer embeddings: {e}")
+        logging.error("Error saving customer embeddings: %s", e)
 
 if __name__ == "__main__":
     # Specify which columns to use for generating embeddings.
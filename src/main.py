@@ -1,6 +1,7 @@
 import os
 import logging
-from anomaly_detection import run_anomaly_detection
+from concurrent.futures import ProcessPoolExecutor
+from anomaly_detection import run_anomaly_detection_parallel
 from embeddings import generate_customer_embeddings
 
 # Configure logging
@@ -11,28 +12,40 @@ def main():
 
     # Define the list of cleaned transaction files (Task 1)
     transaction_files = [
-        "cleaned_abm.csv",
-        "cleaned_card.csv",
-        "cleaned_cheque.csv",
-        "cleaned_eft.csv",
-        "cleaned_emt.csv",
-        "cleaned_wire.csv"
+        "cleaned_abm.parquet",
+        "cleaned_card.parquet",
+        "cleaned_cheque.parquet",
+        "cleaned_eft.parquet",
+        "cleaned_emt.parquet",
+        "cleaned_wire.parquet"
     ]
     clean_dir = os.path.join("mnt", "output", "clean")
     
-    # Run anomaly detection on each cleaned transaction file
+    # Run anomaly detection on the cleaned transaction files; they are independent, so process them in parallel
+    input_paths = []
+    output_filenames = []
     for file_name in transaction_files:
         input_path = os.path.join(clean_dir, file_name)
         # Create an output filename by replacing 'cleaned_' with 'anomaly_detected_'
-        base = file_name.replace("cleaned_", "")
-        output_filename = f"anomaly_detected_{base}"
-        logging.info(f"Running anomaly detection on {input_path}")
-        run_anomaly_detection(input_path, output_filename, contamination=0.01, features=['amount_cad'])
+        base = os.path.splitext(file_name.replace("cleaned_", ""))[0]
+        input_paths.append(input_path)
+        output_filenames.append(f"anomaly_detected_{base}.csv")
     
-    # Generate customer embeddings (Task 3)
-    logging.info("Generating customer embeddings from KYC data...")
-    # Adjust feature columns as needed (e.g., 'employee_count' and 'sales' are used here)
-    generate_customer_embeddings(feature_cols=['employee_count', 'sales'], epochs=20, batch_size=32)
+    # Customer embeddings only depend on the KYC data, so generate them in a background
+    # process while anomaly detection runs
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        # Generate customer embeddings (Task 3)
+        logging.info("Generating customer embeddings from KYC data...")
+        # Adjust feature columns as needed (e.g., 'employee_count' and 'sales' are used here)
+        embeddings_future = executor.submit(generate_customer_embeddings,
+                                            feature_cols=['employee_count', 'sales'], epochs=20, batch_size=32)
+
+        # Leave a core free for the embeddings process
+        run_anomaly_detection_parallel(input_paths, output_filenames, contamination=0.01, features=['amount_cad'],
+                                       reserved_cores=1)
+
+        # Wait for the embeddings to finish, re-raising any error from the background process
+        embeddings_future.result()
     
     logging.info("Production pipeline complete.")
 
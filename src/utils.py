@@ -12,13 +12,13 @@ def load_config(config_path="config.json"):
         try:
             with open(config_path, "r") as f:
                 config = json.load(f)
-            logging.info(f"Configuration loaded from {config_path}")
+            logging.info("Configuration loaded from %s", config_path)
             return config
         except Exception as e:
-            logging.error(f"Error loading config: {e}")
+            logging.error("Error loading config: %s", e)
             return {}
     else:
-        logging.warning(f"No config file found at {config_path}. Using default settings.")
+        logging.warning("No config file found at %s. Using default settings.", config_path)
         return {}
 
 def save_config(config, config_path="config.json"):
@@ -28,9 +28,9 @@ def save_config(config, config_path="config.json"):
     try:
         with open(config_path, "w") as f:
             json.dump(config, f, indent=4)
-        logging.info(f"Configuration saved to {config_path}")
+        logging.info("Configuration saved to %s", config_path)
     except Exception as e:
-        logging.error(f"Error saving config: {e}")
+        logging.error("Error saving config: %s", e)
 
 def ensure_directory(directory_path):
     """
@@ -38,9 +38,9 @@ def ensure_directory(directory_path):
     """
     try:
         os.makedirs(directory_path, exist_ok=True)
-        logging.info(f"Directory ensured: {directory_path}")
+        logging.info("Directory ensured: %s", directory_path)
     except Exception as e:
-        logging.error(f"Error ensuring directory {directory_path}: {e}")
+        logging.error("Error ensuring directory %s: %s", directory_path, e)
 
 def print_separator():
     """
@@ -1,28 +1,32 @@
 import os
+import numpy as np
 import pandas as pd
-import seaborn as sns
 import matplotlib.pyplot as plt
 
 def plot_missing_data(df, title, save_path):
     """
     Generates and saves a heatmap of missing values in the DataFrame.
+    The null mask is drawn as a single image rather than one patch per cell.
     """
-    plt.figure(figsize=(10, 6))
-    sns.heatmap(df.isnull(), cbar=False, cmap="viridis")
-    plt.title(title)
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.close()
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.imshow(df.isna().to_numpy(dtype=np.uint8), aspect='auto', cmap="viridis",
+              interpolation='nearest', vmin=0, vmax=1)
+    ax.set_xticks(range(len(df.columns)))
+    ax.set_xticklabels(df.columns, rotation=90)
+    ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(save_path, dpi=100)
+    plt.close(fig)
 
 def main():
     # Define paths (relative to the project root)
     raw_kyc_path = os.path.join("mnt", "data", "kyc.csv")
-    cleaned_kyc_path = os.path.join("mnt", "output", "clean", "cleaned_kyc.csv")
+    cleaned_kyc_path = os.path.join("mnt", "output", "clean", "cleaned_kyc.parquet")
     
     # Load the raw and cleaned KYC data
     try:
         raw_kyc = pd.read_csv(raw_kyc_path)
-        cleaned_kyc = pd.read_csv(cleaned_kyc_path)
+        cleaned_kyc = pd.read_parquet(cleaned_kyc_path)
     except Exception as e:
         print(f"Error loading data: {e}")
         return